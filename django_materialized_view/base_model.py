@@ -1,7 +1,9 @@
 import datetime
 import logging
+import os
 import time
-from typing import Callable, Dict, Optional, Union, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Sequence, Set, Type, Union, Tuple
 
 from django.conf import settings
 from django.db import DEFAULT_DB_ALIAS, connections, models
@@ -11,14 +13,26 @@ from django.db.models.base import ModelBase
 __all__ = [
     "MaterializedViewModel",
     "DBViewsRegistry",
+    "refresh_all",
 ]
 
 from django_materialized_view.models import MaterializedViewRefreshLog
+from django_materialized_view.sql_functions import quote_identifier, run_in_threads
 
 logger = logging.getLogger(__name__)
 
 DBViewsRegistry: Dict[str, "MaterializedViewModel"] = {}
 
+# (database alias, table name) of views known to have a unique index
+_views_with_unique_index: Set[Tuple[str, str]] = set()
+
+
+@lru_cache(maxsize=512)
+def _read_sql_file(path: str, mtime: float) -> str:
+    """mtime is part of the cache key, so editing the file invalidates the cached content"""
+    with open(path, "r") as sql_file:
+        return sql_file.read()
+
 
 class DBViewModelBase(ModelBase):
     def __new__(mcs, *args, **kwargs):
@@ -26,6 +40,8 @@ class DBViewModelBase(ModelBase):
         assert new_class._meta.managed is False, "For DB View managed must be se to false"  # noqa
         if new_class._meta.abstract is False:  # noqa
             DBViewsRegistry[new_class._meta.db_table] = new_class  # noqa
+            if hasattr(new_class, "get_tablename"):
+                new_class._tablename = new_class.get_tablename()  # noqa
         return new_class
 
 
@@ -47,11 +63,43 @@ class DBMaterializedView(models.Model, metaclass=DBViewModelBase):
         concurrently option requires an index and postgres db
         """
         using = using or DEFAULT_DB_ALIAS
-        with connections[using].cursor() as cursor:
+        db_connection = connections[using]
+        tablename = quote_identifier(cls._meta.db_table)
+        with db_connection.cursor() as cursor:
             if concurrently:
-                cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY %s;" % cls._meta.db_table)
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {tablename};")
             else:
-                cursor.execute("REFRESH MATERIALIZED VIEW %s;" % cls._meta.db_table)
+                cursor.execute(f"REFRESH MATERIALIZED VIEW {tablename};")
+
+    @classmethod
+    def has_unique_index(cls, using: str = DEFAULT_DB_ALIAS) -> bool:
+        """
+        check if the view has a unique index usable by REFRESH MATERIALIZED VIEW CONCURRENTLY.
+        only found indexes are cached, an index may be created later on while the process is running
+        """
+        key = (using, cls._meta.db_table)
+        if key in _views_with_unique_index:
+            return True
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT EXISTS(
+                    SELECT 1
+                    FROM pg_index
+                    WHERE pg_index.indrelid = to_regclass(%s)
+                      AND pg_index.indisunique
+                      AND pg_index.indisvalid
+                      -- partial and expression indexes can not be used for concurrent refresh
+                      AND pg_index.indpred IS NULL
+                      AND pg_index.indexprs IS NULL
+                )
+                """,
+                [quote_identifier(cls._meta.db_table)],
+            )
+            has_unique_index = cursor.fetchone()[0]
+        if has_unique_index:
+            _views_with_unique_index.add(key)
+        return has_unique_index
 
 
 class MaterializedViewModel(DBMaterializedView):
@@ -91,6 +139,7 @@ class MaterializedViewModel(DBMaterializedView):
     """
 
     create_pkey_index = False
+    _tablename: str  # set by DBViewModelBase
 
     class Meta:
         managed = False
@@ -99,18 +148,18 @@ class MaterializedViewModel(DBMaterializedView):
     @classmethod
     def refresh(cls, using: Optional[str] = None, concurrently: Optional[bool] = None) -> None:
         log = MaterializedViewRefreshLog(
-            view_name=cls.get_tablename(),
+            view_name=cls._tablename,
         )
         try:
-            start_time = time.monotonic()
+            start_time = time.perf_counter()
             if concurrently is None:
-                concurrently = cls.create_pkey_index is True
+                concurrently = cls.create_pkey_index is True or cls.has_unique_index(using or DEFAULT_DB_ALIAS)
             super().refresh(using=using, concurrently=concurrently)
-            end_time = time.monotonic()
+            end_time = time.perf_counter()
             log.duration = datetime.timedelta(seconds=end_time - start_time)
         except Exception:  # noqa
             log.failed = True
-            logging.exception(f"failed to refresh materialized view {cls.get_tablename()}")
+            logging.exception(f"failed to refresh materialized view {cls._tablename}")
         log.save()
 
     @classmethod
@@ -126,7 +175,10 @@ class MaterializedViewModel(DBMaterializedView):
                 primary_key_field = cls._meta.pk.db_column
             else:
                 primary_key_field = cls._meta.pk.attname
-            return f"CREATE UNIQUE INDEX {cls.get_tablename()}_pkey ON {cls.get_tablename()} ({primary_key_field})"
+            return (
+                f"CREATE UNIQUE INDEX {quote_identifier(f'{cls._tablename}_pkey')} "
+                f"ON {quote_identifier(cls._tablename)} ({quote_identifier(primary_key_field)})"
+            )
         except Exception as exc:
             print(exc)
             exit(-1)
@@ -150,15 +202,42 @@ class MaterializedViewModel(DBMaterializedView):
         pass
 
     @classmethod
-    def __get_query(cls, *args) -> Tuple[str, tuple]:
+    @lru_cache(maxsize=None)
+    def _compiled_sql(cls) -> Optional[Tuple[str, tuple]]:
+        """
+        compiled sql and params of get_query_from_queryset, None if view is defined by sql file.
+        queryset definitions are expected to be static per process (true for migration commands)
+        """
         queryset = cls.get_query_from_queryset()
         if isinstance(queryset, QuerySet):
-            query, args = queryset.query.sql_with_params()
+            return queryset.query.sql_with_params()
+        return None
+
+    @classmethod
+    def get_sql_file_mtime(cls) -> Optional[float]:
+        """
+        modification time of the sql file, None if view is defined by queryset or sql file does not exist.
+        queryset based views are always compared by hash, because model changes alter the compiled sql.
+        so are views with create_pkey_index, the primary key index is part of the definition as well
+        """
+        if cls.create_pkey_index or isinstance(cls.get_query_from_queryset(), QuerySet):
+            return None
+        try:
+            return os.path.getmtime(cls.__get_sql_file_path())
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def __get_query(cls, *args) -> Tuple[str, tuple]:
+        compiled_sql = cls._compiled_sql()
+        if compiled_sql is not None:
+            query, args = compiled_sql
             sql_query = f"{query}; {cls.__create_index_for_primary_key()}"
             return sql_query, args
         try:
-            with open(cls.__get_sql_file_path(), "r") as sql_file:
-                sql_query = f"{sql_file.read()}; {cls.__create_index_for_primary_key()}"
+            sql_file_path = cls.__get_sql_file_path()
+            sql_file_content = _read_sql_file(sql_file_path, os.path.getmtime(sql_file_path))
+            sql_query = f"{sql_file_content}; {cls.__create_index_for_primary_key()}"
         except FileNotFoundError as exc:
             raise FileNotFoundError(f"{exc}, - please create SQL file and put it to this directory")
         return sql_query, args
@@ -174,3 +253,20 @@ class MaterializedViewModel(DBMaterializedView):
     @classmethod
     def get_tablename(cls) -> str:
         return f"{cls.__get_app_label()}_{cls.__get_class_name()}"
+
+
+def refresh_all(
+    views: Sequence[Type[MaterializedViewModel]],
+    using: Optional[str] = None,
+    concurrently: Optional[bool] = None,
+    max_workers: int = 4,
+) -> None:
+    """
+    refresh materialized views in parallel, every worker thread uses its own db connection.
+    views must not depend on each other - refresh dependent views in a separate call after their parents
+    """
+    run_in_threads(
+        lambda view: view.refresh(using=using, concurrently=concurrently),
+        views,
+        max_workers=max_workers,
+    )
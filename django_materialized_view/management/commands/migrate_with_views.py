@@ -1,23 +1,106 @@
 import re
 
+from django.apps import apps
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from django.db import NotSupportedError
+from django.db import NotSupportedError, connection
+from django.db.migrations import operations
+from django.db.migrations.exceptions import AmbiguityError
+from django.db.migrations.executor import MigrationExecutor
 
 from django_materialized_view.processor import MaterializedViewsProcessor
 
+_MV_NAME_RE = re.compile(r"rule _RETURN on materialized view (\w+) depends on column")
+
+# operations which fail on tables referenced by materialized views, applied forwards and backwards
+_FORWARD_FIELD_OPERATIONS = (operations.AlterField, operations.RemoveField)
+_FORWARD_MODEL_OPERATIONS = (operations.DeleteModel,)
+_BACKWARD_FIELD_OPERATIONS = (operations.AlterField, operations.AddField)
+_BACKWARD_MODEL_OPERATIONS = (operations.CreateModel,)
+
 
 def extract_mv_name(line):
     """
     >>> extract_mv_name('rule _RETURN on materialized view some_materialized_name depends on column')
     'some_materialized_name'
     """
-    pattern = re.compile(r"rule _RETURN on materialized view (\w+) depends on column")
-    match = pattern.search(line)
-    if match:
-        return match.group(1)
-    else:
-        return None
+    match = _MV_NAME_RE.search(line)
+    return match.group(1) if match else None
+
+
+def get_tables_altered_by_plan(plan):
+    """
+    tables of the models whose columns are altered or removed by the migration plan
+    """
+    return {
+        get_table_name(migration.app_label, model_name)
+        for migration, backwards in plan
+        for _, model_name in iter_altering_operations(migration, backwards)
+    }
+
+
+def get_columns_altered_by_plan(plan, loader, tables):
+    """
+    (table, column) pairs changed in the database by migrations of the plan touching tables,
+    column is None if the whole table is dropped
+    """
+    columns = set()
+    for migration, backwards in plan:
+        model_names = {model_name for _, model_name in iter_altering_operations(migration, backwards)}
+        if not any(get_table_name(migration.app_label, model_name) in tables for model_name in model_names):
+            continue
+        state = loader.project_state((migration.app_label, migration.name), at_end=False)
+        for operation in migration.operations:
+            new_state = state.clone()
+            operation.state_forwards(migration.app_label, new_state)
+            # the database matches the state before the operation when applying and after it when unapplying
+            db_state, target_state = (new_state, state) if backwards else (state, new_state)
+            columns.update(get_altered_columns(operation, migration.app_label, backwards, db_state, target_state))
+            state = new_state
+    return columns
+
+
+def get_altered_columns(operation, app_label, backwards, db_state, target_state):
+    field_operations = _BACKWARD_FIELD_OPERATIONS if backwards else _FORWARD_FIELD_OPERATIONS
+    model_operations = _BACKWARD_MODEL_OPERATIONS if backwards else _FORWARD_MODEL_OPERATIONS
+    if isinstance(operation, model_operations):
+        model = db_state.apps.get_model(app_label, operation.name)
+        return {(model._meta.db_table, None)}
+    if not isinstance(operation, field_operations):
+        return set()
+
+    model = db_state.apps.get_model(app_label, operation.model_name)
+    field = model._meta.get_field(operation.name)
+    if field.many_to_many:
+        return set()
+    if isinstance(operation, operations.AlterField):
+        target_field = target_state.apps.get_model(app_label, operation.model_name)._meta.get_field(operation.name)
+        # e.g. choices, help_text or validators do not change the column
+        column_parameters = (field.column, field.db_parameters(connection))
+        if column_parameters == (target_field.column, target_field.db_parameters(connection)):
+            return set()
+    return {(model._meta.db_table, field.column)}
+
+
+def iter_altering_operations(migration, backwards):
+    """
+    operations of the migration which may fail on tables referenced by materialized views with their model names
+    """
+    field_operations = _BACKWARD_FIELD_OPERATIONS if backwards else _FORWARD_FIELD_OPERATIONS
+    model_operations = _BACKWARD_MODEL_OPERATIONS if backwards else _FORWARD_MODEL_OPERATIONS
+    for operation in migration.operations:
+        if isinstance(operation, field_operations):
+            yield operation, operation.model_name
+        elif isinstance(operation, model_operations):
+            yield operation, operation.name
+
+
+def get_table_name(app_label, model_name):
+    try:
+        return apps.get_model(app_label, model_name)._meta.db_table
+    except LookupError:
+        # model removed from the code, django's default table name is the best guess
+        return f"{app_label}_{model_name.lower()}"
 
 
 class Command(BaseCommand):
@@ -29,18 +112,55 @@ class Command(BaseCommand):
         parser.add_argument("args", nargs="*")
 
     def handle(self, *args, **kwargs):
+        executor = MigrationExecutor(connection)
+        plan = self.get_migration_plan(executor, args)
+        # resolving columns needs the project state, so only tables referenced by views are checked
+        tables = {
+            table
+            for table in get_tables_altered_by_plan(plan)
+            if self.view_processor.get_views_depending_on_tables([table])
+        }
+        if tables:
+            columns = get_columns_altered_by_plan(plan, executor.loader, tables)
+            views = self.view_processor.get_views_depending_on_columns(columns)
+            if views:
+                self.delete_views(views)
         try:
             call_command("migrate", args)
         except NotSupportedError as exc:
+            # views depending on tables changed by RunSQL and other operations are not known up front
             print()  # need for new line
             mv_name = extract_mv_name(exc.args[0])
             if not mv_name:
                 raise exc
-            self.views_to_be_recreated.add(mv_name)
-            sorted_views = self.view_processor.get_view_list_sorted_by_dependencies(self.views_to_be_recreated)
-            self.views_to_be_recreated.update(sorted_views)
-            for view in self.views_to_be_recreated:
-                self.view_processor.add_view_to_be_deleted(view)
-            self.view_processor.delete_views()
+            self.delete_views({mv_name})
             self.handle(*args, **kwargs)
         self.view_processor.process_materialized_views()
+
+    def delete_views(self, views):
+        self.views_to_be_recreated.update(views)
+        sorted_views = self.view_processor.get_view_list_sorted_by_dependencies(self.views_to_be_recreated)
+        self.views_to_be_recreated.update(sorted_views)
+        for view in self.views_to_be_recreated:
+            self.view_processor.add_view_to_be_deleted(view)
+        self.view_processor.delete_views()
+
+    @staticmethod
+    def get_migration_plan(executor, args):
+        """
+        migrations migrate would apply for the same arguments, an empty plan if the arguments are invalid
+        """
+        if not args:
+            targets = executor.loader.graph.leaf_nodes()
+        elif len(args) == 1:
+            targets = [key for key in executor.loader.graph.leaf_nodes() if key[0] == args[0]]
+        elif args[1] == "zero":
+            targets = [(args[0], None)]
+        else:
+            try:
+                migration = executor.loader.get_migration_by_prefix(args[0], args[1])
+            except (AmbiguityError, KeyError):
+                # let migrate report the error
+                return []
+            targets = [(migration.app_label, migration.name)]
+        return executor.migration_plan(targets)
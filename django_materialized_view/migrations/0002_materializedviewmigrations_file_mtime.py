@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-15 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_materialized_view', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materializedviewmigrations',
+            name='file_mtime',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 
 __all__ = [
@@ -20,6 +20,7 @@ class MaterializedViewMigrations(models.Model):
     view_name = models.CharField(max_length=255)
     hash = models.CharField(max_length=255)
     deleted = models.BooleanField(default=False)
+    file_mtime = models.FloatField(null=True)
 
     class Meta:
         constraints = [
@@ -29,8 +30,10 @@ class MaterializedViewMigrations(models.Model):
         ]
 
     def save(self, *args, **kwargs):
-        if not self.deleted:
-            MaterializedViewMigrations.objects.filter(app=self.app, view_name=self.view_name, deleted=False).update(
-                deleted=True
-            )
-        return super().save(*args, **kwargs)
+        with transaction.atomic():
+            # only a new active record can replace the previous one, updates of existing records need one query
+            if self._state.adding and not self.deleted:
+                MaterializedViewMigrations.objects.filter(app=self.app, view_name=self.view_name, deleted=False).update(
+                    deleted=True
+                )
+            return super().save(*args, **kwargs)
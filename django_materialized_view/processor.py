@@ -1,17 +1,29 @@
 import hashlib
 import logging
-from collections import OrderedDict, defaultdict
-from typing import Dict, List, Optional, Set, Tuple
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
 
-from django.apps import apps
-from django.db import InternalError, ProgrammingError, connection
+from django.conf import settings
+from django.db import InternalError, ProgrammingError, connection, transaction
+from django.db.models import Case, FloatField, Q, Value, When
 
 from django_materialized_view.base_model import DBViewsRegistry, MaterializedViewModel
 from django_materialized_view.models import MaterializedViewMigrations
-from django_materialized_view.sql_functions import dictfetchall
+from django_materialized_view.sql_functions import dictfetchiter, quote_identifier, run_in_threads
 
 logger = logging.getLogger(__name__)
 
+# characters ignored when comparing view definitions
+_HASH_DROP = str.maketrans("", "", "\" '\n")
+
+
+class _PreviousMigration(NamedTuple):
+    app: str
+    view_name: str
+    hash: str
+    file_mtime: Optional[float]
+
 
 class MaterializedViewsProcessor:
     CREATE_COMMAND_TEMPLATE = "CREATE MATERIALIZED VIEW %s AS %s;"
@@ -19,19 +31,107 @@ class MaterializedViewsProcessor:
     CASCADE = "CASCADE"
     MATERIALIZED_VIEW_FIELD_NAME = "materialized_view"
     REF_TABLE_FIELD_NAME = "ref_table"
+    PARALLEL_MAX_WORKERS = 8
+    TO_BE_CREATED = "to_be_created"
+    TO_BE_RECREATED = "to_be_recreated"
+    TO_BE_DELETED = "to_be_deleted"
+    CREATED = "created"
+    RECREATED = "recreated"
+    DELETED = "deleted"
+
+    # names are mangled the same way as the attributes assigned in __init__
+    __slots__ = (
+        "__max_workers",
+        "__state",
+        "__recreation_priority",
+        "__related_views_cache",
+        "__sorted_views_cache",
+        "__previous_migrations_cache",
+        "__view_names_map",
+        "__pending_migrations",
+        "__view_definitions",
+        "__existing_matviews",
+        "__current_view_models",
+    )
 
     def __init__(
         self,
+        max_workers: Optional[int] = None,
     ):
-        self.__views_to_be_created = set()
-        self.__views_to_be_recreated = set()
-        self.__views_to_be_deleted = set()
-        self.__created_views = set()
-        self.__recreated_views = set()
-        self.__deleted_views = set()
-        self.__recreation_priority = defaultdict(int)
+        """
+        max_workers - number of threads creating views in parallel, each thread uses its own connection.
+        defaults to PARALLEL_MAX_WORKERS if settings.MATERIALIZED_VIEW_PARALLEL is True, otherwise views are created
+        one by one in the current thread
+        """
+        if max_workers is None:
+            max_workers = self.PARALLEL_MAX_WORKERS if getattr(settings, "MATERIALIZED_VIEW_PARALLEL", False) else 1
+        self.__max_workers = max_workers
+        self.__state: Dict[str, Set[str]] = defaultdict(set)
+        self.__recreation_priority: Dict[str, int] = defaultdict(int)
+        self.__related_views_cache: Optional[Dict[str, List[str]]] = None
+        self.__sorted_views_cache: Dict[FrozenSet[str], Dict[str, int]] = {}
+        self.__previous_migrations_cache: Optional[Dict[Tuple[str, str], _PreviousMigration]] = None
+        self.__view_names_map: Optional[Dict[str, Tuple[str, str]]] = None
+        self.__pending_migrations: Dict[Tuple[str, str], MaterializedViewMigrations] = {}
+        self.__view_definitions: Dict[str, Tuple[str, tuple]] = {}
+        self.__existing_matviews: Optional[Set[str]] = None
+        self.__current_view_models: Optional[Dict[Tuple[str, str], MaterializedViewModel]] = None
+
+    @property
+    def __views_to_be_created(self) -> Set[str]:
+        return self.__state[self.TO_BE_CREATED]
+
+    @__views_to_be_created.setter
+    def __views_to_be_created(self, views: Set[str]) -> None:
+        self.__state[self.TO_BE_CREATED] = views
+
+    @property
+    def __views_to_be_recreated(self) -> Set[str]:
+        return self.__state[self.TO_BE_RECREATED]
+
+    @__views_to_be_recreated.setter
+    def __views_to_be_recreated(self, views: Set[str]) -> None:
+        self.__state[self.TO_BE_RECREATED] = views
+
+    @property
+    def __views_to_be_deleted(self) -> Set[str]:
+        return self.__state[self.TO_BE_DELETED]
+
+    @__views_to_be_deleted.setter
+    def __views_to_be_deleted(self, views: Set[str]) -> None:
+        self.__state[self.TO_BE_DELETED] = views
+
+    @property
+    def __created_views(self) -> Set[str]:
+        return self.__state[self.CREATED]
+
+    @__created_views.setter
+    def __created_views(self, views: Set[str]) -> None:
+        self.__state[self.CREATED] = views
+
+    @property
+    def __recreated_views(self) -> Set[str]:
+        return self.__state[self.RECREATED]
+
+    @__recreated_views.setter
+    def __recreated_views(self, views: Set[str]) -> None:
+        self.__state[self.RECREATED] = views
+
+    @property
+    def __deleted_views(self) -> Set[str]:
+        return self.__state[self.DELETED]
+
+    @__deleted_views.setter
+    def __deleted_views(self, views: Set[str]) -> None:
+        self.__state[self.DELETED] = views
 
     def process_materialized_views(self) -> None:
+        # the catalog may have been changed since the last run, e.g. by migrate
+        self.__reset_related_views_cache()
+        self.__previous_migrations_cache = None
+        self.__existing_matviews = None
+        # sql files may have been edited since the last run
+        self.__view_definitions = {}
         self.mark_to_be_applied_new_views()
         self.mark_to_be_deleted_old_views()
         self.create_views()
@@ -49,89 +149,185 @@ class MaterializedViewsProcessor:
 
     def mark_to_be_applied_new_views(self) -> None:
         view_models = self.__get_current_view_models()
+        previous_migrations = self.__get_previous_view_migrations()
+        touched_file_mtimes: Dict[Tuple[str, str], float] = {}
         for (app_label, model_name), view_model in view_models.items():
             view_name = self.__get_view_name(app_label, model_name)
+            previous_migration = previous_migrations.get((app_label, model_name))
+            file_mtime = self.__get_view_file_mtime(view_name) if previous_migration is not None else None
+            if previous_migration is not None and previous_migration.file_mtime is not None:
+                if previous_migration.file_mtime == file_mtime:
+                    logger.debug(f"Skip hash comparison. SQL file not modified. {view_name}")
+                    continue
+
             actual_view_definition, args = self.__get_actual_view_definition(view_name)
             actual_view_definition_hash = self.__get_hash_from_string(
                 actual_view_definition % args if args else actual_view_definition
             )
-            previous_view_definition_hash = self.__get_previous_view_definition_hash(app_label, model_name)
 
-            if previous_view_definition_hash is None:
+            if previous_migration is None:
                 self.add_view_to_be_created(view_name)
-            elif not self.__is_same_views(previous_view_definition_hash, actual_view_definition_hash):
+            elif not self.__is_same_views(previous_migration.hash, actual_view_definition_hash):
                 self.add_view_to_be_recreated(view_name)
+            elif file_mtime is not None:
+                # file touched without changing the definition, e.g. by a fresh checkout
+                touched_file_mtimes[(app_label, model_name)] = file_mtime
+        self.__update_file_mtimes(touched_file_mtimes)
 
     def mark_to_be_deleted_old_views(self) -> None:
-        views_migrations = MaterializedViewMigrations.objects.filter(deleted=False)
-        for view_migration in views_migrations:
-            view_name = self.__get_view_name(view_migration.app, view_migration.view_name)
-            if view_name not in DBViewsRegistry:
-                self.add_view_to_be_deleted(view_name)
+        migrated_views = {
+            self.__get_view_name(app_label, view_name) for app_label, view_name in self.__get_previous_view_migrations()
+        }
+        self.__views_to_be_deleted |= migrated_views - DBViewsRegistry.keys() - self.__views_to_be_created
 
     def create_views(self) -> None:
         logger.info(f"Creating views. {self.__views_to_be_created}")
-        for view_name in tuple(self.__views_to_be_created):
-            logger.info(f"Trying to create view. {view_name}")
-
-            if view_name in self.__created_views:
-                logger.info(f"Skip creating. View already created. {view_name}")
-                self.__remove_view_from_creation_list(view_name)
-                continue
-
-            created = self._create_view(view_name)
-            if not created:
-                logger.info(f"Unable to create view. {view_name}")
-                continue
-
-            logger.info(f"View created. {view_name}")
-            self.__add_view_to_created_list(view_name)
-            self.__remove_view_from_creation_list(view_name)
-
-        if self.__views_to_be_created:
-            logger.debug(f"Views to be created still exist. Trying to create. {self.__views_to_be_created}")
-            self.create_views()
+        # views to be created are not in the catalog yet, so their dependencies are unknown. views failing because
+        # a view they depend on does not exist yet are retried in the next pass, which guarantees the creation order.
+        # each pass creates at least the first view of a dependency chain, so N views need at most N passes
+        view_names = sorted(self.__views_to_be_created)
+        try:
+            for _ in range(len(view_names) + 1):
+                results = run_in_threads(self.__try_create_view, view_names, max_workers=self.__max_workers)
+                view_names = [
+                    view_name
+                    for view_name, created in zip(view_names, results)
+                    if not created and view_name in self.__views_to_be_created
+                ]
+                if not view_names:
+                    break
+                logger.debug(f"Views to be created still exist. Trying to create. {view_names}")
+            else:
+                logger.warning(f"Unable to create views. {self.__views_to_be_created}")
+        finally:
+            # views created before a failure must keep their migrations
+            self.__save_pending_migrations()
+            self.__reset_related_views_cache()
 
     def recreate_views(self) -> None:
         sorted_views = self.get_view_list_sorted_by_dependencies(self.__views_to_be_recreated)
         self.__views_to_be_recreated = set(sorted_views)
 
         logger.info(f"Recreating views. {sorted_views}")
-        for view in sorted_views:
-            logger.info(f"Recreating view. {view}")
-            recreated = self._recreate_view(view, delete_cascade=True)
-            logger.info(f"Recreating view {'success' if recreated else 'failed'}. {view}")
+        try:
+            for view in sorted_views:
+                logger.info(f"Recreating view. {view}")
+                recreated = self._recreate_view(view, delete_cascade=True)
+                logger.info(f"Recreating view {'success' if recreated else 'failed'}. {view}")
+        finally:
+            # views recreated before a failure must keep their migrations
+            self.__save_pending_migrations()
 
     def delete_views(self) -> None:
         logger.info(f"Deleting old views. {self.__views_to_be_deleted}")
-        for view_name in tuple(self.__views_to_be_deleted):
-            deleted = self._delete_view(view_name)
-            if deleted:
-                app, model_view_name = self.__separate_app_name_and_view_name(view_name)
-                MaterializedViewMigrations.objects.filter(app=app, view_name=model_view_name).update(deleted=True)
-                logger.info(f"View {view_name} deleted")
-                self.__add_view_to_deleted_list(view_name)
-                self.__remove_view_from_deletion_list(view_name)
-
-    def get_view_list_sorted_by_dependencies(self, views: Set[str]) -> OrderedDict[str, int]:
+        if not self.__views_to_be_deleted:
+            return
+        self.__reset_related_views_cache()
+        deleted_migrations = []
+        view_names = tuple(self.__views_to_be_deleted)
+        deleted_at_once = len(view_names) > 1 and self._delete_views(view_names)
+        if not deleted_at_once and len(view_names) > 1:
+            view_names = self.__get_views_in_deletion_order(view_names)
+        try:
+            for view_name in view_names:
+                deleted = deleted_at_once or self._delete_view(view_name)
+                if deleted:
+                    deleted_migrations.append(self.__separate_app_name_and_view_name(view_name))
+                    logger.info(f"View {view_name} deleted")
+                    self.__add_view_to_deleted_list(view_name)
+                    self.__remove_view_from_deletion_list(view_name)
+        finally:
+            # views dropped before a failure must be marked as deleted as well
+            if deleted_migrations:
+                MaterializedViewMigrations.objects.filter(
+                    self.__get_migrations_filter(deleted_migrations), deleted=False
+                ).update(deleted=True)
+                self.__previous_migrations_cache = None
+            self.__reset_related_views_cache()
+            self.__existing_matviews = None
+
+    def get_view_list_sorted_by_dependencies(self, views: Set[str]) -> Dict[str, int]:
+        cache_key = frozenset(views)
+        if cache_key in self.__sorted_views_cache:
+            return dict(self.__sorted_views_cache[cache_key])
+
+        self.__recreation_priority = defaultdict(int)
         recreation_list = list(views)
+        recreation_set = set(recreation_list)
         for view in recreation_list:
             dependencies = self.__get_prioritized_views(view)
             for dependency in dependencies:
-                if dependency not in recreation_list:
+                if dependency not in recreation_set:
                     # append new dependencies and iterate over them
                     recreation_list.append(dependency)
-
-        sorted_views = OrderedDict(sorted(self.__recreation_priority.items(), key=lambda item: item[1], reverse=True))
-        return sorted_views
+                    recreation_set.add(dependency)
+
+        priorities = ((view, self.__recreation_priority[view]) for view in recreation_list)
+        sorted_views = dict(sorted(priorities, key=lambda item: item[1], reverse=True))
+        self.__sorted_views_cache[cache_key] = sorted_views
+        return dict(sorted_views)
+
+    def get_views_depending_on_tables(self, tables: Iterable[str]) -> Set[str]:
+        """
+        materialized views directly referencing any of tables
+        """
+        tables = set(tables)
+        if not tables:
+            return set()
+        related_views = self.__get_related_views()
+        return {view_name for table in tables for view_name in related_views.get(table, [])}
+
+    def get_views_depending_on_columns(self, columns: Iterable[Tuple[str, Optional[str]]]) -> Set[str]:
+        """
+        materialized views directly referencing any of the (table, column) pairs, column None matches any column
+        """
+        columns = set(columns)
+        if not columns:
+            return set()
+        tables, column_names = zip(*columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT DISTINCT pg_class.oid::regclass::varchar AS {self.MATERIALIZED_VIEW_FIELD_NAME}
+                FROM pg_depend -- objects that depend on a table
+                         JOIN pg_rewrite -- rules depending on a table
+                              ON pg_rewrite.oid = pg_depend.objid
+                         JOIN pg_class -- views for the rules
+                              ON pg_class.oid = pg_rewrite.ev_class
+                         LEFT JOIN pg_attribute -- referenced column, refobjsubid is its number
+                                   ON pg_attribute.attrelid = pg_depend.refobjid
+                                       AND pg_attribute.attnum = pg_depend.refobjsubid
+                         JOIN unnest(%s::varchar[], %s::varchar[]) AS altered (ref_table, ref_column)
+                              ON pg_depend.refobjid = to_regclass(quote_ident(altered.ref_table))
+                                  AND (altered.ref_column IS NULL OR altered.ref_column = pg_attribute.attname)
+                WHERE pg_depend.classid = 'pg_rewrite'::regclass
+                  AND pg_depend.refclassid = 'pg_class'::regclass
+                  AND pg_depend.deptype = 'n'
+                  AND pg_class.relkind = 'm' -- materialized views only
+                  AND NOT (pg_class.oid = pg_depend.refobjid)
+                """,
+                [list(tables), list(column_names)],
+            )
+            return {row[0] for row in cursor.fetchall()}
 
     def _create_view(self, view_name: str) -> bool:
         logger.debug(f"Creating view: {view_name}")
 
         view_definition, args = self.__get_actual_view_definition(view_name)
+        app, model_view_name = self.__separate_app_name_and_view_name(view_name)
+        actual_view_definition_hash = self.__get_hash_from_string(view_definition % args if args else view_definition)
+        if self.__is_view_up_to_date(view_name, app, model_view_name, actual_view_definition_hash):
+            logger.debug(f"Skip creating. View is up to date. {view_name}")
+            return True
+        if view_name in self.__get_existing_matviews():
+            logger.debug(f"View already exists: {view_name}. Marking to recreate view.")
+            self.add_view_to_be_recreated(view_name)
+            self.__remove_view_from_creation_list(view_name)
+            return False
+
         with connection.cursor() as cursor:
             try:
-                command_view = self.CREATE_COMMAND_TEMPLATE % (view_name, view_definition)
+                command_view = self.__get_create_view_command(view_name, view_definition)
                 if args:
                     cursor.execute(command_view, args)
                 else:
@@ -147,13 +343,18 @@ class MaterializedViewsProcessor:
                     return False
                 else:
                     raise exc
+        if self.__existing_matviews is not None:
+            self.__existing_matviews.add(view_name)
         logger.debug(f"View created: {view_name} ")
         logger.debug(f"Creating migration: {view_name}")
-        app, model_view_name = self.__separate_app_name_and_view_name(view_name)
-        actual_view_definition_hash = self.__get_hash_from_string(view_definition % args if args else view_definition)
-        migration = MaterializedViewMigrations(app=app, view_name=model_view_name, hash=actual_view_definition_hash)
-        migration.save()
-        logger.debug(f"Migration created: {view_name}. migration_id={migration.pk}")
+        migration = MaterializedViewMigrations(
+            app=app,
+            view_name=model_view_name,
+            hash=actual_view_definition_hash,
+            file_mtime=self.__get_view_file_mtime(view_name),
+        )
+        self.__pending_migrations[(app, model_view_name)] = migration
+        logger.debug(f"Migration queued: {view_name}")
         return True
 
     def _recreate_view(self, view_name: str, delete_cascade: bool) -> bool:
@@ -163,6 +364,7 @@ class MaterializedViewsProcessor:
             logger.debug(f"Unable to recreate view. {view_name}")
             return False
         created = self._create_view(view_name)
+        self.__reset_related_views_cache()
         if created:
             logger.debug(f"View recreated. {view_name}")
             self.__add_view_to_recreated_list(view_name)
@@ -170,63 +372,163 @@ class MaterializedViewsProcessor:
         logger.debug(f"Unable to recreate view. {view_name}")
         return created
 
+    def _delete_views(self, view_names: Iterable[str]) -> bool:
+        """
+        drop all views with one statement in one transaction.
+        returns False if a view outside of view_names depends on them, views must be deleted one by one then
+        """
+        logger.debug(f"Deleting views: {view_names}")
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(self.__get_delete_views_command(view_names))
+        except InternalError as exc:
+            logger.debug(f"Unable to delete views at once: {view_names}. Error: {exc.args}")
+            return False
+        if self.__existing_matviews is not None:
+            self.__existing_matviews.difference_update(view_names)
+        logger.debug(f"{view_names} views deleted")
+        return True
+
     def _delete_view(self, view_name: str, cascade: bool = False) -> bool:
+        """
+        views depending on view_name must be deleted before, otherwise the database raises an InternalError
+        """
         logger.debug(f"Deleting view: {view_name}")
         with connection.cursor() as cursor:
-            try:
-                cursor.execute(self.DELETE_VIEW_COMMAND_TEMPLATE % (view_name, self.CASCADE if cascade else ""))
-            except InternalError as exc:
-                logger.debug(f"Unable to delete view: {view_name}. Error: {exc.args}")
-                dependencies = self.__get_prioritized_views(view_name)
-                if not dependencies:
-                    raise exc
-
-                allowed_to_delete = True
-
-                for view in dependencies:
-                    if view not in self.__views_to_be_deleted:
-                        allowed_to_delete = False
-                        break
-
-                if allowed_to_delete:
-                    deleted = self._delete_view(view_name, cascade=True)
-                    return deleted
-                logger.debug(f"Unable to delete. View {view_name} has related view. dependencies: {dependencies}")
-                raise exc
-
+            cursor.execute(self.__get_delete_views_command((view_name,), cascade=cascade))
+        if cascade:
+            # dependent views are dropped as well, they are unknown here
+            self.__existing_matviews = None
+        elif self.__existing_matviews is not None:
+            self.__existing_matviews.discard(view_name)
         logger.debug(f"{view_name} view deleted")
         return True
 
+    def __save_pending_migrations(self) -> None:
+        if not self.__pending_migrations:
+            return
+        with transaction.atomic():
+            MaterializedViewMigrations.objects.filter(
+                self.__get_migrations_filter(self.__pending_migrations.keys()), deleted=False
+            ).update(deleted=True)
+            MaterializedViewMigrations.objects.bulk_create(self.__pending_migrations.values())
+        self.__previous_migrations_cache = None
+        logger.debug(f"Migrations created: {list(self.__pending_migrations)}")
+        self.__pending_migrations = {}
+
+    def __update_file_mtimes(self, file_mtimes: Dict[Tuple[str, str], float]) -> None:
+        """
+        store file_mtime of active migrations with one query, so the next run skips the hash comparison again
+        """
+        if not file_mtimes:
+            return
+        MaterializedViewMigrations.objects.filter(self.__get_migrations_filter(file_mtimes), deleted=False).update(
+            file_mtime=Case(
+                *(
+                    When(app=app, view_name=view_name, then=Value(file_mtime))
+                    for (app, view_name), file_mtime in file_mtimes.items()
+                ),
+                output_field=FloatField(),
+            )
+        )
+        previous_migrations = self.__get_previous_view_migrations()
+        for key, file_mtime in file_mtimes.items():
+            previous_migrations[key] = previous_migrations[key]._replace(file_mtime=file_mtime)
+
     def __add_view_to_created_list(self, view_name: str) -> None:
-        self.__created_views.add(view_name)
+        self.__state[self.CREATED].add(view_name)
 
     def __add_view_to_recreated_list(self, view_name: str) -> None:
-        self.__recreated_views.add(view_name)
+        self.__state[self.RECREATED].add(view_name)
 
     def __add_view_to_deleted_list(self, view_name: str) -> None:
-        self.__deleted_views.add(view_name)
+        self.__state[self.DELETED].add(view_name)
 
     def __remove_view_from_creation_list(self, view_name: str) -> None:
-        if view_name in self.__views_to_be_created:
-            self.__views_to_be_created.remove(view_name)
+        self.__state[self.TO_BE_CREATED].discard(view_name)
 
     def __remove_view_from_recreation_list(self, view_name: str) -> None:
-        if view_name in self.__views_to_be_recreated:
-            self.__views_to_be_recreated.remove(view_name)
+        self.__state[self.TO_BE_RECREATED].discard(view_name)
 
     def __remove_view_from_deletion_list(self, view_name: str) -> None:
-        if view_name in self.__views_to_be_deleted:
-            self.__views_to_be_deleted.remove(view_name)
+        self.__state[self.TO_BE_DELETED].discard(view_name)
+
+    def __get_views_in_deletion_order(self, view_names: Iterable[str]) -> Tuple[str, ...]:
+        """
+        dependent views first, so every view is dropped after all views depending on it
+        """
+        sorted_views = self.get_view_list_sorted_by_dependencies(set(view_names))
+        return tuple(view_name for view_name in reversed(sorted_views) if view_name in view_names)
+
+    def __try_create_view(self, view_name: str) -> bool:
+        logger.info(f"Trying to create view. {view_name}")
+
+        if view_name in self.__created_views:
+            logger.info(f"Skip creating. View already created. {view_name}")
+            self.__remove_view_from_creation_list(view_name)
+            return True
+
+        created = self._create_view(view_name)
+        if not created:
+            logger.info(f"Unable to create view. {view_name}")
+            return False
+
+        logger.info(f"View created. {view_name}")
+        self.__add_view_to_created_list(view_name)
+        self.__remove_view_from_creation_list(view_name)
+        return True
 
     def __get_ref_views(self, view_name: str) -> List[str]:
-        related_views = self.__get_related_views()
-        return [
-            view_obj[self.MATERIALIZED_VIEW_FIELD_NAME]
-            for view_obj in related_views
-            if view_obj[self.REF_TABLE_FIELD_NAME] == view_name
-        ]
+        return self.__get_related_views().get(view_name, [])
+
+    def __get_previous_view_migrations(self) -> Dict[Tuple[str, str], _PreviousMigration]:
+        """
+        active migrations keyed by (app, view_name), loaded with one query and kept until migrations change
+        """
+        if self.__previous_migrations_cache is None:
+            views_migrations = MaterializedViewMigrations.objects.filter(deleted=False).values_list(
+                *_PreviousMigration._fields
+            )
+            migrations = map(_PreviousMigration._make, views_migrations)
+            self.__previous_migrations_cache = {
+                (migration.app, migration.view_name): migration for migration in migrations
+            }
+        return self.__previous_migrations_cache
+
+    def __get_previous_view_definition_hash(self, app_label: str, view_name: str) -> Optional[str]:
+        migration = self.__get_previous_view_migrations().get((app_label, view_name))
+        if migration is None:
+            return None
+        return migration.hash
 
-    def __get_actual_view_definition(self, view_name: str) -> str:
+    def __is_view_up_to_date(self, view_name: str, app_label: str, model_name: str, actual_hash: str) -> bool:
+        previous_hash = self.__get_previous_view_definition_hash(app_label, model_name)
+        if previous_hash is None or not self.__is_same_views(previous_hash, actual_hash):
+            return False
+        return view_name in self.__get_existing_matviews()
+
+    def __get_existing_matviews(self) -> Set[str]:
+        """
+        names of materialized views in the current schema, loaded with one query and kept up to date by the DDL
+        issued here, so existence checks do not hit the database.
+        only comparable with table names of registered views, names from regclass may be quoted or schema qualified
+        """
+        if self.__existing_matviews is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT matviewname FROM pg_matviews WHERE schemaname = current_schema()")
+                self.__existing_matviews = {row[0] for row in cursor.fetchall()}
+        return self.__existing_matviews
+
+    def __reset_related_views_cache(self) -> None:
+        self.__related_views_cache = None
+        self.__sorted_views_cache = {}
+
+    def __get_actual_view_definition(self, view_name: str) -> Tuple[str, tuple]:
+        if view_name not in self.__view_definitions:
+            self.__view_definitions[view_name] = self.__build_view_definition(view_name)
+        return self.__view_definitions[view_name]
+
+    def __build_view_definition(self, view_name: str) -> Tuple[str, tuple]:
         view_model = DBViewsRegistry[view_name]
         if callable(view_model.view_definition):
             raw_view_definition, args = view_model.view_definition()
@@ -235,24 +537,34 @@ class MaterializedViewsProcessor:
         view_definition = self.__get_cleaned_view_definition_value(raw_view_definition)
         return view_definition, args
 
-    def __prioritize_view(self, view: str, related_views: List[str], dependencies_story: set[str]) -> None:
-        if related_views:
-            dependencies_story.update(related_views)
+    def __prioritize_view(self, view: str) -> Set[str]:
+        """
+        walk all views depending on view breadth-first, so deep chains do not hit the recursion limit.
+        priority of view grows by one for every walked view having dependent views
+        """
+        dependencies_story: Set[str] = set()
+        self.__recreation_priority[view] += 0
+        frontier = deque([view])
+        while frontier:
+            related_views = self.__get_ref_views(frontier.popleft())
+            if not related_views:
+                continue
             self.__recreation_priority[view] += 1
-        else:
-            self.__recreation_priority[view] += 0
-
-        for related_view in related_views:
-            ref_views = self.__get_ref_views(related_view)
-            self.__prioritize_view(view, ref_views, dependencies_story)
-
-    def __get_prioritized_views(self, view_name: str) -> set[str]:
-        ref_views = self.__get_ref_views(view_name)
-        dependencies_story = set()  # type: ignore
-        self.__prioritize_view(view_name, ref_views, dependencies_story)
+            # views already in dependencies_story were walked before, skipping them keeps diamonds and cycles linear
+            new_related_views = [related for related in related_views if related not in dependencies_story]
+            dependencies_story.update(new_related_views)
+            frontier.extend(new_related_views)
         return dependencies_story
 
-    def __get_related_views(self) -> List[Dict[str, str]]:
+    def __get_prioritized_views(self, view_name: str) -> Set[str]:
+        return self.__prioritize_view(view_name)
+
+    def __get_related_views(self) -> Dict[str, List[str]]:
+        """
+        materialized views grouped by the table they reference, queried once per catalog state
+        """
+        if self.__related_views_cache is not None:
+            return self.__related_views_cache
         with connection.cursor() as cursor:
             cursor.execute(
                 f"""
@@ -275,8 +587,11 @@ class MaterializedViewsProcessor:
                   AND NOT (pg_class.oid = pg_depend.refobjid)
                 """
             )
-            row = dictfetchall(cursor)
-        return row
+            related_views = defaultdict(list)
+            for view_obj in dictfetchiter(cursor):
+                related_views[view_obj[self.REF_TABLE_FIELD_NAME]].append(view_obj[self.MATERIALIZED_VIEW_FIELD_NAME])
+        self.__related_views_cache = dict(related_views)
+        return self.__related_views_cache
 
     @staticmethod
     def __get_cleaned_view_definition_value(view_definition: str) -> str:
@@ -286,17 +601,44 @@ class MaterializedViewsProcessor:
         return view_definition.strip()
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def __get_hash_from_string(string: str) -> str:
-        string = string.replace('"', "").replace(" ", "").replace("\n", "").replace("'", "").lower()
-        return hashlib.md5(string.encode()).hexdigest()
+        string = string.translate(_HASH_DROP).lower()
+        return hashlib.blake2b(string.encode(), digest_size=16).hexdigest()
 
     @staticmethod
-    def __get_previous_view_definition_hash(app_label: str, view_name: str) -> Optional[str]:
-        try:
-            hash_obj = MaterializedViewMigrations.objects.get(app=app_label, view_name=view_name, deleted=False)
-        except MaterializedViewMigrations.DoesNotExist:
+    def __get_view_identifier(view_name: str) -> str:
+        """
+        table names of registered views are quoted if needed,
+        other names come from ::regclass or postgres errors and are sql identifiers already
+        """
+        if view_name not in DBViewsRegistry:
+            return view_name
+        return quote_identifier(view_name)
+
+    @classmethod
+    def __get_create_view_command(cls, view_name: str, view_definition: str) -> str:
+        return cls.CREATE_COMMAND_TEMPLATE % (cls.__get_view_identifier(view_name), view_definition)
+
+    @classmethod
+    def __get_delete_views_command(cls, view_names: Iterable[str], cascade: bool = False) -> str:
+        quoted_view_names = ", ".join(cls.__get_view_identifier(view_name) for view_name in view_names)
+        return cls.DELETE_VIEW_COMMAND_TEMPLATE % (quoted_view_names, cls.CASCADE if cascade else "")
+
+    @staticmethod
+    def __get_view_file_mtime(view_name: str) -> Optional[float]:
+        # views defined directly on DBMaterializedView have no sql file
+        get_sql_file_mtime = getattr(DBViewsRegistry.get(view_name), "get_sql_file_mtime", None)
+        if get_sql_file_mtime is None:
             return None
-        return hash_obj.hash
+        return get_sql_file_mtime()
+
+    @staticmethod
+    def __get_migrations_filter(views: Iterable[Tuple[str, str]]) -> Q:
+        migrations_filter = Q()
+        for app, view_name in views:
+            migrations_filter |= Q(app=app, view_name=view_name)
+        return migrations_filter
 
     @staticmethod
     def __is_same_views(previous_hash: str, actual_hash: str) -> bool:
@@ -306,21 +648,29 @@ class MaterializedViewsProcessor:
             raise TypeError("actual_hash must be a string")
         return previous_hash == actual_hash
 
-    @staticmethod
-    def __get_current_view_models() -> Dict[Tuple[str, str], MaterializedViewModel]:
-        view_models = {}
-        for app_label, models_list in apps.all_models.items():
-            for model_name, model_class in models_list.items():
-                if model_class._meta.db_table in DBViewsRegistry:  # noqa
-                    key = (app_label, model_name)
-                    view_models[key] = model_class
-        return view_models
+    def __get_current_view_models(self) -> Dict[Tuple[str, str], MaterializedViewModel]:
+        """
+        view models keyed by (app_label, model_name), the registry is filled when view model classes are defined
+        """
+        if self.__current_view_models is None:
+            self.__current_view_models = {
+                (view_model._meta.app_label, view_model._meta.model_name): view_model  # noqa
+                for view_model in DBViewsRegistry.values()
+            }
+        return self.__current_view_models
 
     @staticmethod
     def __get_view_name(app_label: str, model_name: str) -> str:
         return "_".join((app_label, model_name))
 
-    @staticmethod
-    def __separate_app_name_and_view_name(full_view_name: str) -> Tuple[str, str]:
+    def __separate_app_name_and_view_name(self, full_view_name: str) -> Tuple[str, str]:
+        if self.__view_names_map is None:
+            self.__view_names_map = {
+                view_name: (view_model._meta.app_label, view_model._meta.model_name)  # noqa
+                for view_name, view_model in DBViewsRegistry.items()
+            }
+        if full_view_name in self.__view_names_map:
+            return self.__view_names_map[full_view_name]
+        # views which are not registered anymore, e.g. deleted ones
         app_name, view_name = full_view_name.rsplit("_", 1)
         return app_name, view_name
@@ -1,9 +1,55 @@
-from typing import List
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Sequence, TypeVar
 
-from django.db import connection
+from django.db import connection, connections
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_PLAIN_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*")
 
 
 def dictfetchall(cursor: connection.cursor) -> List[dict]:
     """Return all rows from a cursor as a dict"""
     columns = [col[0] for col in cursor.description]
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def dictfetchiter(cursor: connection.cursor, size: int = 1000) -> Iterator[dict]:
+    """Yield rows from a cursor as a dict, fetching them in chunks of size rows"""
+    columns = tuple(col[0] for col in cursor.description)
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Quote a table name of a view unless it is a plain identifier.
+    Plain identifiers stay unquoted, postgres folds them to lower case as for views created without quoting.
+    """
+    if _PLAIN_IDENTIFIER_RE.fullmatch(name):
+        return name
+    return connection.ops.quote_name(name)
+
+
+def run_in_threads(func: Callable[[T], R], items: Sequence[T], max_workers: int) -> List[R]:
+    """
+    Call func for every item in a thread pool, every thread uses and closes its own db connection.
+    Runs in the current thread if there is nothing to parallelize.
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    def run_with_own_connection(item: T) -> R:
+        try:
+            return func(item)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(run_with_own_connection, items))
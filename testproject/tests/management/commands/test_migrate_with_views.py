@@ -1,8 +1,15 @@
-from unittest.mock import call
-
-from django.db import NotSupportedError
-
-from django_materialized_view.management.commands.migrate_with_views import Command, extract_mv_name
+from unittest.mock import MagicMock, call
+
+from django.db import NotSupportedError, connection, migrations, models
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.state import ModelState, ProjectState
+
+from django_materialized_view.management.commands.migrate_with_views import (
+    Command,
+    extract_mv_name,
+    get_columns_altered_by_plan,
+    get_tables_altered_by_plan,
+)
 from django_materialized_view.processor import MaterializedViewsProcessor
 
 
@@ -13,16 +20,135 @@ class TestExtractMvName:
         result = extract_mv_name(test_string)
         assert result == expected_string
 
+    def test__extract_mv_name__no_match(self):
+        result = extract_mv_name("cannot alter type of a column used by a view or rule")
+        assert result is None
+
+
+class TestGetTablesAlteredByPlan:
+    def test__get_tables_altered_by_plan__success(self, subtests):
+        migration = migrations.Migration("0002_test", "someapp")
+        migration.operations = [
+            migrations.AddField("added", "field", models.IntegerField()),
+            migrations.AlterField("altered", "field", models.IntegerField()),
+            migrations.RemoveField("removed", "field"),
+            migrations.CreateModel("Created", fields=[]),
+            migrations.DeleteModel("Deleted"),
+        ]
+
+        with subtests.test(msg="forwards"):
+            result = get_tables_altered_by_plan([(migration, False)])
+            assert result == {"someapp_altered", "someapp_removed", "someapp_deleted"}
+
+        with subtests.test(msg="backwards"):
+            result = get_tables_altered_by_plan([(migration, True)])
+            assert result == {"someapp_added", "someapp_altered", "someapp_created"}
+
+
+class TestGetColumnsAlteredByPlan:
+    def setup_method(self):
+        state = ProjectState()
+        state.add_model(
+            ModelState(
+                "someapp",
+                "Model",
+                [
+                    ("id", models.AutoField(primary_key=True)),
+                    ("number", models.IntegerField()),
+                    ("label", models.CharField(max_length=10)),
+                    ("removed", models.IntegerField()),
+                ],
+            )
+        )
+        self.loader = MagicMock()
+        self.loader.project_state.return_value = state
+
+    def test__get_columns_altered_by_plan__forwards(self):
+        migration = migrations.Migration("0002_test", "someapp")
+        migration.operations = [
+            migrations.AlterField("model", "number", models.IntegerField(help_text="no sql")),
+            migrations.AlterField("model", "label", models.TextField()),
+            migrations.RemoveField("model", "removed"),
+        ]
+        migration_two = migrations.Migration("0003_test", "someapp")
+        migration_two.operations = [migrations.DeleteModel("Model")]
+
+        result = get_columns_altered_by_plan(
+            [(migration, False), (migration_two, False)], self.loader, {"someapp_model"}
+        )
+
+        assert result == {("someapp_model", "label"), ("someapp_model", "removed"), ("someapp_model", None)}
+
+    def test__get_columns_altered_by_plan__backwards(self):
+        migration = migrations.Migration("0002_test", "someapp")
+        migration.operations = [migrations.AddField("model", "added", models.IntegerField())]
+
+        result = get_columns_altered_by_plan([(migration, True)], self.loader, {"someapp_model"})
+
+        assert result == {("someapp_model", "added")}
+
+    def test__get_columns_altered_by_plan__other_tables(self):
+        migration = migrations.Migration("0002_test", "someapp")
+        migration.operations = [migrations.RemoveField("model", "removed")]
+
+        result = get_columns_altered_by_plan([(migration, False)], self.loader, {"otherapp_model"})
+
+        assert result == set()
+        self.loader.project_state.assert_not_called()
+
 
 class TestCommand:
     def setup_method(self):
         self.command = Command()
+        self.command.views_to_be_recreated = set()
+
+    def test__handle__deletes_views_before_migrate(self, mocker, db):
+        view_name = "test_view_name"
+        view_name_two = "test_view_name_two"
+
+        mocker.patch.object(Command, "get_migration_plan", return_value=[])
+        get_tables_mock = mocker.patch(
+            "django_materialized_view.management.commands.migrate_with_views.get_tables_altered_by_plan",
+            return_value={"test_table"},
+        )
+        get_views_mock = mocker.patch.object(
+            MaterializedViewsProcessor, "get_views_depending_on_tables", return_value={view_name}
+        )
+        get_columns_mock = mocker.patch(
+            "django_materialized_view.management.commands.migrate_with_views.get_columns_altered_by_plan",
+            return_value={("test_table", "test_column")},
+        )
+        get_column_views_mock = mocker.patch.object(
+            MaterializedViewsProcessor, "get_views_depending_on_columns", return_value={view_name}
+        )
+        call_command_mock = mocker.patch("django_materialized_view.management.commands.migrate_with_views.call_command")
+        mocker.patch.object(
+            MaterializedViewsProcessor, "get_view_list_sorted_by_dependencies", return_value=[view_name_two]
+        )
+        add_view_to_be_deleted_mock = mocker.patch.object(MaterializedViewsProcessor, "add_view_to_be_deleted")
+        delete_views_mock = mocker.patch.object(MaterializedViewsProcessor, "delete_views")
+        view_processor_mock = mocker.patch.object(MaterializedViewsProcessor, "process_materialized_views")
+
+        self.command.handle()
+
+        get_tables_mock.assert_called_once_with([])
+        get_views_mock.assert_called_once_with(["test_table"])
+        assert get_columns_mock.call_args.args[2] == {"test_table"}
+        get_column_views_mock.assert_called_once_with({("test_table", "test_column")})
+        assert call_command_mock.call_args_list == [call("migrate", ())]
+        assert call(view_name) in add_view_to_be_deleted_mock.call_args_list
+        assert call(view_name_two) in add_view_to_be_deleted_mock.call_args_list
+        assert delete_views_mock.call_args_list == [call()]
+        assert view_processor_mock.call_args_list == [call()]
+        assert self.command.views_to_be_recreated == {view_name, view_name_two}
 
     def test__handle__handle_error(self, mocker, db):
         view_name = "test_view_name"
         view_name_two = "test_view_name_two"
         error_message = f"rule _RETURN on materialized view {view_name} depends on column some column"
 
+        # e.g. columns changed by RunSQL are not found in the migration plan
+        mocker.patch.object(Command, "get_migration_plan", return_value=[])
         call_command_mock = mocker.patch("django_materialized_view.management.commands.migrate_with_views.call_command")
         call_command_mock.side_effect = [NotSupportedError(error_message), None]
 
@@ -50,9 +176,19 @@ class TestCommand:
         assert self.command.views_to_be_recreated == {view_name, view_name_two}
 
     def test__handle__handle_without_error(self, mocker, db):
+        mocker.patch.object(Command, "get_migration_plan", return_value=[])
         call_command_mock = mocker.patch("django_materialized_view.management.commands.migrate_with_views.call_command")
         view_processor_mock = mocker.patch.object(MaterializedViewsProcessor, "process_materialized_views")
 
         self.command.handle()
         call_command_mock.assert_called_once_with("migrate", ())
         view_processor_mock.assert_called_once_with()
+
+    def test__get_migration_plan__success(self, db, subtests):
+        executor = MigrationExecutor(connection)
+
+        with subtests.test(msg="all migrations applied"):
+            assert self.command.get_migration_plan(executor, ()) == []
+
+        with subtests.test(msg="unknown migration"):
+            assert self.command.get_migration_plan(executor, ("django_materialized_view", "9999")) == []
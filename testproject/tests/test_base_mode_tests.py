@@ -1,12 +1,12 @@
 import hashlib
-from collections import OrderedDict
+from itertools import chain
 from unittest.mock import MagicMock, call
 
 import pytest
-from django.db import InternalError
+from django.db import InternalError, ProgrammingError, connection
 from pytest_django.asserts import assertNumQueries
 
-from django_materialized_view.base_model import DBViewsRegistry
+from django_materialized_view.base_model import DBViewsRegistry, MaterializedViewModel, refresh_all
 from django_materialized_view.models import MaterializedViewMigrations
 from django_materialized_view.processor import MaterializedViewsProcessor
 from testproject.tests.factories import MaterializedViewMigrationsFactory
@@ -31,12 +31,42 @@ class TestMaterializedViewsProcessor:
         )
         assert (test_app_name, test_view_name) == (app_name, view_name)
 
+    def test__separate_app_name_and_view_name__registered_view(self, mocker):
+        test_view_model = MagicMock()
+        test_view_model._meta.app_label = "my_app"
+        test_view_model._meta.model_name = "viewname"
+        mocker.patch.dict(DBViewsRegistry, {"my_app_viewname": test_view_model})
+
+        app_name, view_name = self.view_processor._MaterializedViewsProcessor__separate_app_name_and_view_name(
+            "my_app_viewname"
+        )
+
+        assert (app_name, view_name) == ("my_app", "viewname")
+
     def test__get_current_view_models__success(self):
         view_models = self.view_processor._MaterializedViewsProcessor__get_current_view_models()
         assert isinstance(view_models, dict)
         assert set(DBViewsRegistry.values()) == set(view_models.values())
         assert set([tuple(i.split("_")) for i in DBViewsRegistry.keys()]) == set(view_models.keys())
 
+    def test__get_current_view_models__cached(self):
+        view_models = self.view_processor._MaterializedViewsProcessor__get_current_view_models()
+        assert self.view_processor._MaterializedViewsProcessor__get_current_view_models() is view_models
+
+    def test__get_view_file_mtime__success(self, mocker, subtests):
+        view_model = MagicMock()
+        view_model.get_sql_file_mtime.return_value = 1.0
+        mocker.patch.dict(DBViewsRegistry, {"app_view": view_model, "app_rawview": type("RawView", (), {})})
+
+        with subtests.test(msg="sql file view"):
+            assert self.view_processor._MaterializedViewsProcessor__get_view_file_mtime("app_view") == 1.0
+
+        with subtests.test(msg="view without sql file"):
+            assert self.view_processor._MaterializedViewsProcessor__get_view_file_mtime("app_rawview") is None
+
+        with subtests.test(msg="unknown view"):
+            assert self.view_processor._MaterializedViewsProcessor__get_view_file_mtime("app_unknown") is None
+
     def test__is_same_views__success(self):
         result = self.view_processor._MaterializedViewsProcessor__is_same_views("test", "test")
         assert result is True
@@ -54,6 +84,24 @@ class TestMaterializedViewsProcessor:
                 self.view_processor._MaterializedViewsProcessor__is_same_views("test", 1)
             assert exc.value.args == ("actual_hash must be a string",)
 
+    @pytest.mark.django_db
+    def test__get_previous_view_migrations__success(self):
+        test_app_name = "app"
+        test_view_name = "viewname"
+        other_migration = MaterializedViewMigrationsFactory()
+        migration_obj = MaterializedViewMigrationsFactory(app=test_app_name, view_name=test_view_name)
+        MaterializedViewMigrationsFactory(deleted=True)
+
+        with assertNumQueries(1):
+            result = self.view_processor._MaterializedViewsProcessor__get_previous_view_migrations()
+
+        assert set(result) == {(test_app_name, test_view_name), (other_migration.app, other_migration.view_name)}
+        assert result[(test_app_name, test_view_name)].hash == migration_obj.hash
+
+        with assertNumQueries(0):
+            cached_result = self.view_processor._MaterializedViewsProcessor__get_previous_view_migrations()
+        assert cached_result is result
+
     @pytest.mark.django_db
     def test__get_previous_view_definition_hash__success(self):
         test_app_name = "app"
@@ -74,11 +122,12 @@ class TestMaterializedViewsProcessor:
             result = self.view_processor._MaterializedViewsProcessor__get_previous_view_definition_hash(
                 test_app_name, test_view_name
             )
+            self.view_processor._MaterializedViewsProcessor__get_previous_view_definition_hash("app2", "viewname2")
         assert result is None
 
     def test__get_hash_from_string__success(self):
         string = "test_string"
-        string_hash = hashlib.md5(string.encode()).hexdigest()
+        string_hash = hashlib.blake2b(string.encode(), digest_size=16).hexdigest()
         test_string = f'"{string}   "\n'
         result = self.view_processor._MaterializedViewsProcessor__get_hash_from_string(test_string)
         assert result == string_hash
@@ -88,6 +137,13 @@ class TestMaterializedViewsProcessor:
         result = self.view_processor._MaterializedViewsProcessor__get_cleaned_view_definition_value(string)
         assert result == string
 
+    def test__get_cleaned_view_definition_value__keeps_sql_intact(self):
+        view_definition = 'SELECT "id" -- primary key\nFROM "app_model" WHERE name = \'test\''
+        result = self.view_processor._MaterializedViewsProcessor__get_cleaned_view_definition_value(
+            f"\n  {view_definition}  \n"
+        )
+        assert result == view_definition
+
     def test__get_cleaned_view_definition_value__invalid(self):
         with pytest.raises(AssertionError) as exc:
             self.view_processor._MaterializedViewsProcessor__get_cleaned_view_definition_value(1)
@@ -97,7 +153,18 @@ class TestMaterializedViewsProcessor:
     def test__get_related_views__success(self):
         with assertNumQueries(1):
             result = self.view_processor._MaterializedViewsProcessor__get_related_views()
-        assert set([i["materialized_view"] for i in result]) == set(DBViewsRegistry.keys())
+        assert set(chain.from_iterable(result.values())) == set(DBViewsRegistry.keys())
+
+    @pytest.mark.django_db
+    def test__get_related_views__cached(self):
+        with assertNumQueries(1):
+            result = self.view_processor._MaterializedViewsProcessor__get_related_views()
+            cached_result = self.view_processor._MaterializedViewsProcessor__get_related_views()
+        assert cached_result is result
+
+        self.view_processor._MaterializedViewsProcessor__reset_related_views_cache()
+        with assertNumQueries(1):
+            self.view_processor._MaterializedViewsProcessor__get_related_views()
 
     def test__get_prioritized_views__success(self, mocker):
         test_view_name = "test"
@@ -111,21 +178,37 @@ class TestMaterializedViewsProcessor:
         test_view_name = "test"
         test_view_name_two = "test3"
         test_related_views = ["test1", "test2"]
-        test_dependencies_story = set()
 
-        mocker.patch.object(
+        get_ref_views_mock = mocker.patch.object(
             MaterializedViewsProcessor,
             "_MaterializedViewsProcessor__get_ref_views",
-            side_effect=([test_view_name], [test_view_name_two], [], []),
-        )
-        self.view_processor._MaterializedViewsProcessor__prioritize_view(
-            view=test_view_name,
-            related_views=test_related_views,
-            dependencies_story=test_dependencies_story,
+            side_effect=(test_related_views, [test_view_name], [], [test_view_name_two], []),
         )
-        assert test_dependencies_story == {test_view_name, test_view_name_two, *test_related_views}
+        dependencies_story = self.view_processor._MaterializedViewsProcessor__prioritize_view(view=test_view_name)
+
+        assert get_ref_views_mock.call_args_list == [
+            call(test_view_name),
+            call("test1"),
+            call("test2"),
+            call(test_view_name),
+            call(test_view_name_two),
+        ]
+        assert dependencies_story == {test_view_name, test_view_name_two, *test_related_views}
         assert self.view_processor._MaterializedViewsProcessor__recreation_priority == {test_view_name: 3}
 
+    def test__prioritize_view__deep_chain(self, mocker):
+        chain_length = 5000
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_ref_views",
+            side_effect=lambda view_name: [view_name + 1] if view_name < chain_length else [],
+        )
+
+        dependencies_story = self.view_processor._MaterializedViewsProcessor__prioritize_view(view=0)
+
+        assert dependencies_story == set(range(1, chain_length + 1))
+        assert self.view_processor._MaterializedViewsProcessor__recreation_priority == {0: chain_length}
+
     def test__get_actual_view_definition__success(self, mocker, subtests):
         test_view_definition = "test"
         with subtests.test(msg="view_definition callable"):
@@ -143,19 +226,39 @@ class TestMaterializedViewsProcessor:
             get_cleaned_view_mock.assert_called_once_with("test raw query")
             assert result == (test_view_definition, ())
 
-    def test__get_ref_views__success(self, mocker):
+        with subtests.test(msg="view_definition is computed once per view"):
+            result = self.view_processor._MaterializedViewsProcessor__get_actual_view_definition("test")
+
+            test_view_mock.view_definition.assert_called_once_with()
+            get_cleaned_view_mock.assert_called_once_with("test raw query")
+            assert result == (test_view_definition, ())
+
+    def test__process_materialized_views__resets_caches(self, mocker):
+        self.view_processor._MaterializedViewsProcessor__related_views_cache = {"test_ref_view": ["test_mt_view"]}
+        self.view_processor._MaterializedViewsProcessor__existing_matviews = {"test_mt_view"}
+        self.view_processor._MaterializedViewsProcessor__view_definitions = {"test_mt_view": ("SELECT 1", ())}
+        for method_name in (
+            "mark_to_be_applied_new_views",
+            "mark_to_be_deleted_old_views",
+            "create_views",
+            "recreate_views",
+            "delete_views",
+        ):
+            mocker.patch.object(MaterializedViewsProcessor, method_name)
+
+        self.view_processor.process_materialized_views()
+
+        assert self.view_processor._MaterializedViewsProcessor__related_views_cache is None
+        assert self.view_processor._MaterializedViewsProcessor__existing_matviews is None
+        assert self.view_processor._MaterializedViewsProcessor__view_definitions == {}
+
+    def test__get_ref_views__success(self, mocker, subtests):
         ref_view_name = "test_ref_view"
         test_mt_view_name = "test_mt_view"
-        test_ref_views = [
-            {
-                self.view_processor.MATERIALIZED_VIEW_FIELD_NAME: test_mt_view_name,
-                self.view_processor.REF_TABLE_FIELD_NAME: ref_view_name,
-            },
-            {
-                self.view_processor.MATERIALIZED_VIEW_FIELD_NAME: "else",
-                self.view_processor.REF_TABLE_FIELD_NAME: "else",
-            },
-        ]
+        test_ref_views = {
+            ref_view_name: [test_mt_view_name],
+            "else": ["else"],
+        }
         get_related_views_mock = mocker.patch.object(
             MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_related_views", return_value=test_ref_views
         )
@@ -165,6 +268,10 @@ class TestMaterializedViewsProcessor:
         get_related_views_mock.assert_called_once()
         assert result == [test_mt_view_name]
 
+        with subtests.test(msg="unknown view has no ref views"):
+            result = self.view_processor._MaterializedViewsProcessor__get_ref_views("unknown")
+            assert result == []
+
     def test__remove_view_from_deletion_list__success(self):
         test_mt_view_name = "test_mt_view"
         self.view_processor._MaterializedViewsProcessor__views_to_be_deleted.add(test_mt_view_name)
@@ -233,48 +340,84 @@ class TestMaterializedViewsProcessor:
         with pytest.raises(InternalError) as exc:
             self.view_processor._delete_view(test_mt_view_name)
 
-        get_prioritized_views_mock.assert_called_once_with(test_mt_view_name)
+        connection_mock().__enter__().execute.assert_called_once()
+        get_prioritized_views_mock.assert_not_called()
         assert exc.value.args == (test_exception_message,)
 
-    def test__delete_view__returns_false(self, mocker):
+    def test__delete_view__cascade(self, mocker):
         test_mt_view_name = "test_mt_view"
-        test_mt_view_name_two = "test_mt_view_two"
-
-        test_exception_message = "test_exception"
 
         connection_mock = mocker.patch("django.db.connection.cursor")
-        connection_mock().__enter__().execute.side_effect = [InternalError(test_exception_message), None]
-        get_prioritized_views_mock = mocker.patch.object(
-            MaterializedViewsProcessor,
-            "_MaterializedViewsProcessor__get_prioritized_views",
-            return_value=[test_mt_view_name_two],
-        )
-        self.view_processor._MaterializedViewsProcessor__views_to_be_deleted.add(test_mt_view_name_two)
 
-        result = self.view_processor._delete_view(test_mt_view_name)
+        result = self.view_processor._delete_view(test_mt_view_name, cascade=True)
 
-        get_prioritized_views_mock.assert_called_once_with(test_mt_view_name)
+        connection_mock().__enter__().execute.assert_called_once_with(
+            "DROP MATERIALIZED VIEW IF EXISTS test_mt_view CASCADE;"
+        )
         assert result is True
 
-    def test__delete_view__raises_error_not_allowed_to_delete(self, mocker):
-        test_mt_view_name = "test_mt_view"
-        test_mt_view_name_two = "test_mt_view_two"
+    def test__get_delete_views_command__success(self, subtests, mocker):
+        mocker.patch.dict(DBViewsRegistry, {"test": MagicMock(), "Test-View": MagicMock()})
 
-        test_exception_message = "test_exception"
+        with subtests.test(msg="registered names are quoted if needed"):
+            command = self.view_processor._MaterializedViewsProcessor__get_delete_views_command(["test", "Test-View"])
+            assert command == 'DROP MATERIALIZED VIEW IF EXISTS test, "Test-View" ;'
 
-        connection_mock = mocker.patch("django.db.connection.cursor")
-        connection_mock().__enter__().execute.side_effect = InternalError(test_exception_message)
-        get_prioritized_views_mock = mocker.patch.object(
+        with subtests.test(msg="names from regclass are passed through"):
+            command = self.view_processor._MaterializedViewsProcessor__get_delete_views_command(
+                ["other.app_view", '"Other-View"']
+            )
+            assert command == 'DROP MATERIALIZED VIEW IF EXISTS other.app_view, "Other-View" ;'
+
+        with subtests.test(msg="cascade"):
+            command = self.view_processor._MaterializedViewsProcessor__get_delete_views_command(["test"], cascade=True)
+            assert command == "DROP MATERIALIZED VIEW IF EXISTS test CASCADE;"
+
+    def test__get_create_view_command__success(self, subtests, mocker):
+        mocker.patch.dict(DBViewsRegistry, {"MyView": MagicMock(), "my view": MagicMock()})
+
+        with subtests.test(msg="plain identifiers are not quoted"):
+            command = self.view_processor._MaterializedViewsProcessor__get_create_view_command("MyView", "SELECT 1")
+            assert command == "CREATE MATERIALIZED VIEW MyView AS SELECT 1;"
+
+        with subtests.test(msg="other names are quoted"):
+            command = self.view_processor._MaterializedViewsProcessor__get_create_view_command("my view", "SELECT 1")
+            assert command == 'CREATE MATERIALIZED VIEW "my view" AS SELECT 1;'
+
+    def test__delete_views__deletes_dependent_views_first(self, mocker):
+        self.view_processor._MaterializedViewsProcessor__views_to_be_deleted = {"test_parent", "test_child"}
+        mocker.patch.object(MaterializedViewsProcessor, "_delete_views", return_value=False)
+        mocker.patch.object(
             MaterializedViewsProcessor,
-            "_MaterializedViewsProcessor__get_prioritized_views",
-            return_value=[test_mt_view_name_two],
+            "get_view_list_sorted_by_dependencies",
+            return_value={"test_parent": 1, "test_other": 1, "test_child": 0},
         )
+        delete_view_mock = mocker.patch.object(MaterializedViewsProcessor, "_delete_view", return_value=True)
+        mocker.patch("django_materialized_view.processor.MaterializedViewMigrations")
 
-        with pytest.raises(InternalError) as exc:
-            self.view_processor._delete_view(test_mt_view_name)
+        self.view_processor.delete_views()
 
-        get_prioritized_views_mock.assert_called_once_with(test_mt_view_name)
-        assert exc.value.args == (test_exception_message,)
+        assert delete_view_mock.call_args_list == [call("test_child"), call("test_parent")]
+        assert self.view_processor._MaterializedViewsProcessor__deleted_views == {"test_parent", "test_child"}
+
+    def test__delete_views__marks_views_deleted_before_error(self, mocker):
+        self.view_processor._MaterializedViewsProcessor__views_to_be_deleted = {"app_parent", "app_child"}
+        mocker.patch.object(MaterializedViewsProcessor, "_delete_views", return_value=False)
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "get_view_list_sorted_by_dependencies",
+            return_value={"app_parent": 1, "app_child": 0},
+        )
+        mocker.patch.object(
+            MaterializedViewsProcessor, "_delete_view", side_effect=[True, InternalError("test_exception")]
+        )
+        migrations_mock = mocker.patch("django_materialized_view.processor.MaterializedViewMigrations")
+
+        with pytest.raises(InternalError):
+            self.view_processor.delete_views()
+
+        migrations_mock.objects.filter().update.assert_called_once_with(deleted=True)
+        assert self.view_processor._MaterializedViewsProcessor__deleted_views == {"app_child"}
 
     def test__recreate_view__success(self, mocker):
         test_mt_view_name = "test_mt_view"
@@ -319,30 +462,49 @@ class TestMaterializedViewsProcessor:
             return_value=view_definition,
         )
 
+        # loading previous migrations, loading existing views and creating the view
         with assertNumQueries(3):
             result = self.view_processor._create_view(full_view_name)
 
         assert result is True
         get_actual_view_definition_mock.assert_called_once_with(full_view_name)
+        assert MaterializedViewMigrations.objects.filter(app=test_app_name, view_name=test_view_name).count() == 0
+        self.view_processor._MaterializedViewsProcessor__save_pending_migrations()
         assert MaterializedViewMigrations.objects.filter(app=test_app_name, view_name=test_view_name).count() == 1
 
+        with subtests.test(msg="up to date view is not created again"):
+            # existing views are known since the view was created
+            with assertNumQueries(1):
+                result = self.view_processor._create_view(full_view_name)
+            assert result is True
+            assert self.view_processor._MaterializedViewsProcessor__pending_migrations == {}
+            assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == set()
+
         with subtests.test(msg="returns False"):
+            MaterializedViewMigrations.objects.all().delete()
+            self.view_processor._MaterializedViewsProcessor__previous_migrations_cache = None
             with assertNumQueries(1):
                 result = self.view_processor._create_view(full_view_name)
             assert result is False
             assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == {full_view_name}
             assert self.view_processor._MaterializedViewsProcessor__views_to_be_created == set()
 
-    def test__get_view_list_sorted_by_dependencies__success(self, mocker):
+    def test__get_view_list_sorted_by_dependencies__success(self, mocker, subtests):
         views = ["test_view", "test_view2"]
-        depend_views = ["test_depend_view"]
+        dependencies = {"test_view": ["test_depend_view"], "test_view2": [], "test_depend_view": []}
+        priorities = {"test_view": 2, "test_view2": 5, "test_depend_view": 1}
+        recreation_priority = self.view_processor._MaterializedViewsProcessor__recreation_priority
+        recreation_priority["stale_view"] = 10
+
+        def prioritize_view(view_name):
+            self.view_processor._MaterializedViewsProcessor__recreation_priority[view_name] += priorities[view_name]
+            return dependencies[view_name]
 
         get_prioritized_views_mock = mocker.patch.object(
             MaterializedViewsProcessor,
             "_MaterializedViewsProcessor__get_prioritized_views",
-            side_effect=[depend_views, [], []],
+            side_effect=prioritize_view,
         )
-        self.view_processor._MaterializedViewsProcessor__recreation_priority = {"test": 2, "test2": 1, "test3": 5}
 
         sorted_views = self.view_processor.get_view_list_sorted_by_dependencies(views)
 
@@ -352,7 +514,36 @@ class TestMaterializedViewsProcessor:
             call("test_view2"),
             call("test_depend_view"),
         ]
-        assert sorted_views == OrderedDict({"test3": 5, "test": 2, "test2": 1})
+        assert sorted_views == {"test_view2": 5, "test_view": 2, "test_depend_view": 1}
+        assert list(sorted_views) == ["test_view2", "test_view", "test_depend_view"]
+
+        with subtests.test(msg="result is memoized per set of views"):
+            cached_sorted_views = self.view_processor.get_view_list_sorted_by_dependencies(set(views))
+
+            assert get_prioritized_views_mock.call_count == 3
+            assert list(cached_sorted_views) == list(sorted_views)
+
+    def test__get_prioritized_views__diamond_and_cycle(self, mocker, subtests):
+        with subtests.test(msg="shared dependency is walked once"):
+            graph = {"a": ["b", "c"], "b": ["d"], "c": ["d"], "d": []}
+            get_ref_views_mock = mocker.patch.object(
+                MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_ref_views", side_effect=graph.get
+            )
+
+            result = self.view_processor._MaterializedViewsProcessor__get_prioritized_views("a")
+
+            assert result == {"b", "c", "d"}
+            assert get_ref_views_mock.call_args_list == [call("a"), call("b"), call("c"), call("d")]
+
+        with subtests.test(msg="cyclic dependencies terminate"):
+            graph = {"a": ["b"], "b": ["a"]}
+            mocker.patch.object(
+                MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_ref_views", side_effect=graph.get
+            )
+
+            result = self.view_processor._MaterializedViewsProcessor__get_prioritized_views("a")
+
+            assert result == {"a", "b"}
 
     @pytest.mark.django_db
     def test__delete_views__success(self, mocker):
@@ -380,8 +571,120 @@ class TestMaterializedViewsProcessor:
         delete_view_mock.assert_called_once_with(view_name)
         separate_name_mock.assert_called_once_with(view_name)
 
+    @pytest.mark.django_db
+    def test__delete_views__updates_migrations_in_one_query(self, mocker):
+        view_names = {"app_test", "app_test2"}
+        self.view_processor._MaterializedViewsProcessor__views_to_be_deleted = set(view_names)
+        delete_views_mock = mocker.patch.object(MaterializedViewsProcessor, "_delete_views", return_value=True)
+        delete_view_mock = mocker.patch.object(MaterializedViewsProcessor, "_delete_view", return_value=True)
+        migration = MaterializedViewMigrationsFactory(app="app", view_name="test")
+        migration_two = MaterializedViewMigrationsFactory(app="app", view_name="test2")
+        other_migration = MaterializedViewMigrationsFactory()
+
+        with assertNumQueries(1):
+            self.view_processor.delete_views()
+
+        deleted_migrations = MaterializedViewMigrations.objects.filter(pk__in=[migration.pk, migration_two.pk])
+        assert set(deleted_migrations.values_list("deleted", flat=True)) == {True}
+        other_migration.refresh_from_db()
+        assert other_migration.deleted is False
+        assert self.view_processor._MaterializedViewsProcessor__deleted_views == view_names
+        delete_views_mock.assert_called_once()
+        assert set(delete_views_mock.call_args.args[0]) == view_names
+        delete_view_mock.assert_not_called()
+
+    @pytest.mark.django_db
+    def test__get_views_depending_on_columns__success(self, subtests):
+        with subtests.test(msg="nothing altered"):
+            with assertNumQueries(0):
+                assert self.view_processor.get_views_depending_on_columns([]) == set()
+
+        with subtests.test(msg="no dependent views"):
+            columns = [
+                (MaterializedViewMigrations._meta.db_table, "hash"),
+                (MaterializedViewMigrations._meta.db_table, None),
+            ]
+            with assertNumQueries(1):
+                assert self.view_processor.get_views_depending_on_columns(columns) == set()
+
+    def test__delete_views__nothing_to_delete(self, mocker):
+        delete_views_mock = mocker.patch.object(MaterializedViewsProcessor, "_delete_views")
+        delete_view_mock = mocker.patch.object(MaterializedViewsProcessor, "_delete_view")
+        migrations_mock = mocker.patch("django_materialized_view.processor.MaterializedViewMigrations")
+
+        self.view_processor.delete_views()
+
+        delete_views_mock.assert_not_called()
+        delete_view_mock.assert_not_called()
+        migrations_mock.objects.filter.assert_not_called()
+
+    @pytest.mark.django_db
+    def test__get_existing_matviews__cached(self):
+        with assertNumQueries(1):
+            existing_matviews = self.view_processor._MaterializedViewsProcessor__get_existing_matviews()
+        with assertNumQueries(0):
+            assert self.view_processor._MaterializedViewsProcessor__get_existing_matviews() is existing_matviews
+
+    def test__delete_views__falls_back_to_one_by_one(self, mocker):
+        view_names = {"app_test", "app_test2"}
+        self.view_processor._MaterializedViewsProcessor__views_to_be_deleted = set(view_names)
+        mocker.patch.object(MaterializedViewsProcessor, "_delete_views", return_value=False)
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "get_view_list_sorted_by_dependencies",
+            return_value={"app_test": 0, "app_test2": 0},
+        )
+        delete_view_mock = mocker.patch.object(
+            MaterializedViewsProcessor, "_delete_view", side_effect=[True, InternalError("test_exception")]
+        )
+        mocker.patch("django_materialized_view.processor.MaterializedViewMigrations")
+
+        with pytest.raises(InternalError):
+            self.view_processor.delete_views()
+
+        assert sorted(c.args[0] for c in delete_view_mock.call_args_list) == ["app_test", "app_test2"]
+        assert len(self.view_processor._MaterializedViewsProcessor__deleted_views) == 1
+        assert len(self.view_processor._MaterializedViewsProcessor__views_to_be_deleted) == 1
+
+    @pytest.mark.django_db
+    def test__delete_views_at_once__success(self):
+        result = self.view_processor._delete_views(["test_mt_view", "test_mt_view_two"])
+
+        assert result is True
+
+    def test__delete_views_at_once__returns_false(self, mocker):
+        connection_mock = mocker.patch("django.db.connection.cursor")
+        connection_mock().__enter__().execute.side_effect = InternalError("test_exception")
+        mocker.patch("django_materialized_view.processor.transaction")
+
+        result = self.view_processor._delete_views(["test_mt_view", "test_mt_view_two"])
+
+        assert result is False
+
+    @pytest.mark.django_db
+    def test__save_pending_migrations__success(self):
+        test_app_name = "app"
+        test_view_name = "viewname"
+        previous_migration = MaterializedViewMigrationsFactory(app=test_app_name, view_name=test_view_name)
+        self.view_processor._MaterializedViewsProcessor__pending_migrations = {
+            (test_app_name, test_view_name): MaterializedViewMigrations(
+                app=test_app_name, view_name=test_view_name, hash="test_hash"
+            ),
+        }
+
+        self.view_processor._MaterializedViewsProcessor__save_pending_migrations()
+
+        previous_migration.refresh_from_db()
+        assert previous_migration.deleted is True
+        migration = MaterializedViewMigrations.objects.get(app=test_app_name, view_name=test_view_name, deleted=False)
+        assert migration.hash == "test_hash"
+        assert self.view_processor._MaterializedViewsProcessor__pending_migrations == {}
+
+        with assertNumQueries(0):
+            self.view_processor._MaterializedViewsProcessor__save_pending_migrations()
+
     def test__recreate_views__success(self, mocker):
-        sorted_views = OrderedDict({"test3": 5, "test": 2, "test2": 1})
+        sorted_views = {"test3": 5, "test": 2, "test2": 1}
         self.view_processor._MaterializedViewsProcessor__views_to_be_recreated = {"test"}
 
         get_view_list_sorted_by_dependencies_mock = mocker.patch.object(
@@ -409,7 +712,6 @@ class TestMaterializedViewsProcessor:
     def test__create_views__success(self, mocker):
         view_name = "test"
         self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name}
-
         create_view_mock = mocker.patch.object(
             MaterializedViewsProcessor,
             "_create_view",
@@ -426,7 +728,6 @@ class TestMaterializedViewsProcessor:
         view_name = "test"
         self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name}
         self.view_processor._MaterializedViewsProcessor__created_views = {view_name}
-
         create_view_mock = mocker.patch.object(
             MaterializedViewsProcessor,
             "_create_view",
@@ -442,7 +743,6 @@ class TestMaterializedViewsProcessor:
     def test__create_views__not_created(self, mocker):
         view_name = "test"
         self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name}
-
         create_view_mock = mocker.patch.object(
             MaterializedViewsProcessor,
             "_create_view",
@@ -455,14 +755,330 @@ class TestMaterializedViewsProcessor:
         assert self.view_processor._MaterializedViewsProcessor__views_to_be_created == set()
         assert self.view_processor._MaterializedViewsProcessor__created_views == {view_name}
 
+    def test__create_views__retries_only_deferred_views(self, mocker):
+        view_name = "test_view"
+        # sorted before the view it depends on, dependencies of views to be created are unknown
+        dependent_view_name = "test_a_dependent_view"
+        self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name, dependent_view_name}
+        get_sorted_views_mock = mocker.patch.object(MaterializedViewsProcessor, "get_view_list_sorted_by_dependencies")
+
+        create_view_mock = mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_create_view",
+            side_effect=[False, True, True],
+        )
+
+        self.view_processor.create_views()
+
+        assert create_view_mock.call_args_list == [
+            call(dependent_view_name),
+            call(view_name),
+            call(dependent_view_name),
+        ]
+        get_sorted_views_mock.assert_not_called()
+        assert self.view_processor._MaterializedViewsProcessor__views_to_be_created == set()
+        assert self.view_processor._MaterializedViewsProcessor__created_views == {view_name, dependent_view_name}
+
+    def test__create_views__gives_up_after_bounded_attempts(self, mocker):
+        view_name = "test"
+        self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name}
+        create_view_mock = mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_create_view",
+            return_value=False,
+        )
+
+        self.view_processor.create_views()
+
+        assert create_view_mock.call_count == 2
+        assert self.view_processor._MaterializedViewsProcessor__views_to_be_created == {view_name}
+        assert self.view_processor._MaterializedViewsProcessor__created_views == set()
+
+    def test__create_views__saves_migrations_before_error(self, mocker):
+        self.view_processor._MaterializedViewsProcessor__views_to_be_created = {"test", "test2"}
+        mocker.patch.object(MaterializedViewsProcessor, "_create_view", side_effect=[True, ProgrammingError("test")])
+        save_pending_migrations_mock = mocker.patch.object(
+            MaterializedViewsProcessor, "_MaterializedViewsProcessor__save_pending_migrations"
+        )
+
+        with pytest.raises(ProgrammingError):
+            self.view_processor.create_views()
+
+        save_pending_migrations_mock.assert_called_once_with()
+        assert self.view_processor._MaterializedViewsProcessor__created_views == {"test"}
+
+    def test__recreate_views__saves_migrations_before_error(self, mocker):
+        self.view_processor._MaterializedViewsProcessor__views_to_be_recreated = {"test", "test2"}
+        mocker.patch.object(
+            MaterializedViewsProcessor, "get_view_list_sorted_by_dependencies", return_value={"test": 1, "test2": 0}
+        )
+        mocker.patch.object(MaterializedViewsProcessor, "_recreate_view", side_effect=[True, ProgrammingError("test")])
+        save_pending_migrations_mock = mocker.patch.object(
+            MaterializedViewsProcessor, "_MaterializedViewsProcessor__save_pending_migrations"
+        )
+
+        with pytest.raises(ProgrammingError):
+            self.view_processor.recreate_views()
+
+        save_pending_migrations_mock.assert_called_once_with()
+
+    def test__slots__success(self):
+        assert not hasattr(self.view_processor, "__dict__")
+        with pytest.raises(AttributeError):
+            self.view_processor.unknown_attribute = True
+
+    def test__max_workers__from_settings(self, settings, subtests):
+        with subtests.test(msg="sequential by default"):
+            view_processor = MaterializedViewsProcessor()
+            assert view_processor._MaterializedViewsProcessor__max_workers == 1
+
+        with subtests.test(msg="parallel if enabled in settings"):
+            settings.MATERIALIZED_VIEW_PARALLEL = True
+            view_processor = MaterializedViewsProcessor()
+            max_workers = view_processor._MaterializedViewsProcessor__max_workers
+            assert max_workers == MaterializedViewsProcessor.PARALLEL_MAX_WORKERS
+
+        with subtests.test(msg="explicit max_workers wins"):
+            view_processor = MaterializedViewsProcessor(max_workers=2)
+            assert view_processor._MaterializedViewsProcessor__max_workers == 2
+
+    def test__create_views__in_parallel(self, mocker):
+        view_names = {"test", "test2", "test3"}
+        view_processor = MaterializedViewsProcessor(max_workers=3)
+        view_processor._MaterializedViewsProcessor__views_to_be_created = set(view_names)
+        run_in_threads_mock = mocker.patch(
+            "django_materialized_view.processor.run_in_threads", side_effect=lambda func, items, max_workers: [True] * 3
+        )
+
+        view_processor.create_views()
+
+        run_in_threads_mock.assert_called_once()
+        assert run_in_threads_mock.call_args.args[1] == ["test", "test2", "test3"]
+        assert run_in_threads_mock.call_args.kwargs == {"max_workers": 3}
+
+    @pytest.mark.django_db
+    def test__mark_to_be_applied_new_views__file_mtime(self, mocker, subtests):
+        test_app_name = "app"
+        test_view_name = "viewname"
+        full_view_name = f"{test_app_name}_{test_view_name}"
+        MaterializedViewMigrationsFactory(app=test_app_name, view_name=test_view_name, file_mtime=1.0)
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_current_view_models",
+            return_value={(test_app_name, test_view_name): MagicMock()},
+        )
+        get_actual_view_definition_mock = mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_actual_view_definition",
+            return_value=("SELECT 1", ()),
+        )
+
+        with subtests.test(msg="unchanged file skips hash comparison"):
+            mocker.patch.object(
+                MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_view_file_mtime", return_value=1.0
+            )
+
+            self.view_processor.mark_to_be_applied_new_views()
+
+            get_actual_view_definition_mock.assert_not_called()
+            assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == set()
+
+        with subtests.test(msg="modified file compares hashes"):
+            mocker.patch.object(
+                MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_view_file_mtime", return_value=2.0
+            )
+
+            self.view_processor.mark_to_be_applied_new_views()
+
+            get_actual_view_definition_mock.assert_called_once_with(full_view_name)
+            assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == {full_view_name}
+
+    @pytest.mark.django_db
+    def test__mark_to_be_applied_new_views__touched_file(self, mocker):
+        test_app_name = "app"
+        test_view_name = "viewname"
+        view_definition = "SELECT 1"
+        view_definition_hash = MaterializedViewsProcessor._MaterializedViewsProcessor__get_hash_from_string(
+            view_definition
+        )
+        migration = MaterializedViewMigrationsFactory(
+            app=test_app_name, view_name=test_view_name, hash=view_definition_hash, file_mtime=1.0
+        )
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_current_view_models",
+            return_value={(test_app_name, test_view_name): MagicMock()},
+        )
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_actual_view_definition",
+            return_value=(view_definition, ()),
+        )
+        mocker.patch.object(
+            MaterializedViewsProcessor, "_MaterializedViewsProcessor__get_view_file_mtime", return_value=2.0
+        )
+
+        # loading previous migrations and updating file_mtime
+        with assertNumQueries(2):
+            self.view_processor.mark_to_be_applied_new_views()
+
+        migration.refresh_from_db()
+        assert migration.file_mtime == 2.0
+        assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == set()
+        previous_migrations = self.view_processor._MaterializedViewsProcessor__get_previous_view_migrations()
+        assert previous_migrations[(test_app_name, test_view_name)].file_mtime == 2.0
+
+    @pytest.mark.django_db
+    def test__mark_to_be_applied_new_views__legacy_md5_hash(self, mocker):
+        test_app_name = "app"
+        test_view_name = "viewname"
+        view_definition = "SELECT 1"
+        legacy_hash = hashlib.md5(view_definition.replace(" ", "").lower().encode()).hexdigest()
+        MaterializedViewMigrationsFactory(app=test_app_name, view_name=test_view_name, hash=legacy_hash)
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_current_view_models",
+            return_value={(test_app_name, test_view_name): MagicMock()},
+        )
+        mocker.patch.object(
+            MaterializedViewsProcessor,
+            "_MaterializedViewsProcessor__get_actual_view_definition",
+            return_value=(view_definition, ()),
+        )
+
+        self.view_processor.mark_to_be_applied_new_views()
+
+        assert self.view_processor._MaterializedViewsProcessor__views_to_be_recreated == {
+            f"{test_app_name}_{test_view_name}"
+        }
+
     @pytest.mark.django_db
     def test__mark_to_be_deleted_old_views__success(self):
         view_name = "test"
         self.view_processor._MaterializedViewsProcessor__views_to_be_created = {view_name}
         migration = MaterializedViewMigrationsFactory()
 
-        self.view_processor.mark_to_be_deleted_old_views()
+        with assertNumQueries(1):
+            self.view_processor.mark_to_be_deleted_old_views()
 
         assert self.view_processor._MaterializedViewsProcessor__views_to_be_deleted == {
             f"{migration.app}_{migration.view_name}"
         }
+
+
+@pytest.mark.django_db
+class TestMaterializedViewMigrations:
+    def test__save__replaces_active_migration(self):
+        previous_migration = MaterializedViewMigrationsFactory(app="app", view_name="viewname")
+
+        migration = MaterializedViewMigrationsFactory(app="app", view_name="viewname")
+
+        previous_migration.refresh_from_db()
+        assert previous_migration.deleted is True
+        assert MaterializedViewMigrations.objects.get(app="app", view_name="viewname", deleted=False) == migration
+
+    def test__save__existing_migration_keeps_active(self):
+        migration = MaterializedViewMigrationsFactory(app="app", view_name="viewname")
+        migration.hash = "test_hash"
+
+        migration.save()
+
+        migration.refresh_from_db()
+        assert migration.deleted is False
+        assert migration.hash == "test_hash"
+
+
+class TestMaterializedViewModel:
+    def test__get_sql_file_mtime__success(self, mocker, settings, subtests):
+        settings.BASE_DIR = "/project"
+        getmtime_mock = mocker.patch("django_materialized_view.base_model.os.path.getmtime", return_value=1.0)
+
+        with subtests.test(msg="sql file"):
+            assert MaterializedViewModel.get_sql_file_mtime() == 1.0
+
+        with subtests.test(msg="primary key index is compared by hash"):
+            getmtime_mock.reset_mock()
+            mocker.patch.object(MaterializedViewModel, "create_pkey_index", True)
+            assert MaterializedViewModel.get_sql_file_mtime() is None
+            getmtime_mock.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "index_sql, expected",
+        [
+            ("", False),
+            ("CREATE INDEX test_index_view_idx ON test_index_view (id)", False),
+            ("CREATE UNIQUE INDEX test_index_view_idx ON test_index_view (id)", True),
+            ("CREATE UNIQUE INDEX test_index_view_idx ON test_index_view (id) WHERE id > 0", False),
+            ("CREATE UNIQUE INDEX test_index_view_idx ON test_index_view ((id + 1))", False),
+        ],
+        ids=["no index", "not unique", "unique", "partial", "expression"],
+    )
+    def test__has_unique_index__success(self, db, mocker, index_sql, expected):
+        mocker.patch("django_materialized_view.base_model._views_with_unique_index", set())
+        mocker.patch.object(MaterializedViewModel._meta, "db_table", "test_index_view")
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE MATERIALIZED VIEW test_index_view AS SELECT 1 AS id;")
+            if index_sql:
+                cursor.execute(index_sql)
+
+        assert MaterializedViewModel.has_unique_index() is expected
+
+    def test__has_unique_index__caches_only_found_index(self, mocker, subtests):
+        mocker.patch("django_materialized_view.base_model._views_with_unique_index", set())
+        connections_mock = mocker.patch("django_materialized_view.base_model.connections")
+        cursor_mock = connections_mock["default"].cursor().__enter__()
+
+        with subtests.test(msg="missing index is checked again"):
+            cursor_mock.fetchone.return_value = (False,)
+            assert MaterializedViewModel.has_unique_index() is False
+            assert MaterializedViewModel.has_unique_index() is False
+            assert cursor_mock.execute.call_count == 2
+
+        with subtests.test(msg="found index is cached"):
+            cursor_mock.reset_mock()
+            cursor_mock.fetchone.return_value = (True,)
+            assert MaterializedViewModel.has_unique_index() is True
+            assert MaterializedViewModel.has_unique_index() is True
+            assert cursor_mock.execute.call_count == 1
+
+    def test__refresh__concurrently_by_default(self, mocker, subtests):
+        mocker.patch.object(MaterializedViewModel, "_tablename", "test_view", create=True)
+        mocker.patch("django_materialized_view.base_model.MaterializedViewRefreshLog")
+        refresh_mock = mocker.patch("django_materialized_view.base_model.DBMaterializedView.refresh")
+        has_unique_index_mock = mocker.patch.object(MaterializedViewModel, "has_unique_index", return_value=False)
+
+        with subtests.test(msg="without unique index"):
+            MaterializedViewModel.refresh()
+            has_unique_index_mock.assert_called_once_with("default")
+            refresh_mock.assert_called_once_with(using=None, concurrently=False)
+
+        with subtests.test(msg="with unique index"):
+            refresh_mock.reset_mock()
+            has_unique_index_mock.return_value = True
+            MaterializedViewModel.refresh(using="default")
+            refresh_mock.assert_called_once_with(using="default", concurrently=True)
+
+        with subtests.test(msg="with primary key index"):
+            refresh_mock.reset_mock()
+            has_unique_index_mock.reset_mock()
+            mocker.patch.object(MaterializedViewModel, "create_pkey_index", True)
+            MaterializedViewModel.refresh()
+            has_unique_index_mock.assert_not_called()
+            refresh_mock.assert_called_once_with(using=None, concurrently=True)
+
+        with subtests.test(msg="explicit concurrently wins"):
+            refresh_mock.reset_mock()
+            MaterializedViewModel.refresh(concurrently=False)
+            refresh_mock.assert_called_once_with(using=None, concurrently=False)
+
+
+class TestRefreshAll:
+    def test__refresh_all__success(self, mocker):
+        close_all_mock = mocker.patch("django_materialized_view.sql_functions.connections.close_all")
+        views = [MagicMock(), MagicMock(), MagicMock()]
+
+        refresh_all(views, using="default", concurrently=True, max_workers=2)
+
+        for view in views:
+            view.refresh.assert_called_once_with(using="default", concurrently=True)
+        assert close_all_mock.call_count == len(views)
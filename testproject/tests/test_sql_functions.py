@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from django_materialized_view.sql_functions import quote_identifier, run_in_threads
+
+
+class TestQuoteIdentifier:
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            ("app_view", "app_view"),
+            ("MyView", "MyView"),
+            ("_view$1", "_view$1"),
+            ("my-view", '"my-view"'),
+            ("1view", '"1view"'),
+            ("my view", '"my view"'),
+        ],
+    )
+    def test__quote_identifier__success(self, name, expected):
+        assert quote_identifier(name) == expected
+
+
+class TestRunInThreads:
+    def test__run_in_threads__sequential(self, mocker, subtests):
+        close_all_mock = mocker.patch("django_materialized_view.sql_functions.connections.close_all")
+        threads = []
+
+        def func(item):
+            threads.append(threading.current_thread())
+            return item * 2
+
+        with subtests.test(msg="single worker"):
+            assert run_in_threads(func, [1, 2, 3], max_workers=1) == [2, 4, 6]
+
+        with subtests.test(msg="single item"):
+            assert run_in_threads(func, [4], max_workers=4) == [8]
+
+        assert threads == [threading.current_thread()] * 4
+        close_all_mock.assert_not_called()
+
+    def test__run_in_threads__pooled(self, mocker):
+        closing_threads = []
+        mocker.patch(
+            "django_materialized_view.sql_functions.connections.close_all",
+            side_effect=lambda: closing_threads.append(threading.current_thread()),
+        )
+        threads = []
+
+        def func(item):
+            threads.append(threading.current_thread())
+            # later items finish first
+            time.sleep((4 - item) / 100)
+            return item * 2
+
+        result = run_in_threads(func, [1, 2, 3], max_workers=3)
+
+        assert result == [2, 4, 6]
+        assert threading.current_thread() not in threads
+        # every worker closes the connections it used
+        assert sorted(closing_threads, key=id) == sorted(threads, key=id)